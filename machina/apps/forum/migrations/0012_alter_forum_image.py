@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-08-26 23:47
+
+from django.db import migrations
+import machina.apps.forum.abstract_models
+import machina.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0011_auto_20190627_2132'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='forum',
+            name='image',
+            field=machina.models.fields.ExtendedImageField(blank=True, height=70, null=True, upload_to=machina.apps.forum.abstract_models.get_forum_image_upload_to, verbose_name='Forum image', width=100),
+        ),
+    ]
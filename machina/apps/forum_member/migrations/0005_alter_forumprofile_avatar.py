@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-08-26 23:47
+
+from django.db import migrations
+import machina.apps.forum_member.abstract_models
+import machina.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum_member', '0004_auto_20181103_1406'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='forumprofile',
+            name='avatar',
+            field=machina.models.fields.ExtendedImageField(blank=True, height=250, null=True, upload_to=machina.apps.forum_member.abstract_models.get_profile_avatar_upload_to, verbose_name='Avatar', width=150),
+        ),
+    ]
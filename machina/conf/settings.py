@@ -21,6 +21,7 @@ MARKUP_WIDGET = getattr(
     settings, 'MACHINA_MARKUP_WIDGET', 'machina.forms.widgets.MarkdownTextareaWidget'
 )
 MARKUP_WIDGET_KWARGS = getattr(settings, 'MACHINA_MARKUP_WIDGET_KWARGS', {})
+MARKUP_CACHE_SIZE = getattr(settings, 'MACHINA_MARKUP_CACHE_SIZE', 1024)
 BASE_TEMPLATE_NAME = getattr(settings, 'MACHINA_BASE_TEMPLATE_NAME', '_base.html')
 USER_DISPLAY_NAME_METHOD = getattr(
     settings,
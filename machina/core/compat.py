@@ -15,3 +15,11 @@ except ImportError:  # pragma: no cover
         raise ImproperlyConfigured(
             _('Neither Pillow nor PIL could be imported: {}').format(err)
         )
+
+
+# PILImageLanczos
+try:
+    PILImageLanczos = PILImage.Resampling.LANCZOS
+except AttributeError:  # pragma: no cover
+    # Pillow < 9.1 exposes the resampling filters directly on the Image module.
+    PILImageLanczos = PILImage.LANCZOS
@@ -1,31 +1,39 @@
-from functools import partial
+import hashlib
+from functools import lru_cache, partial
+from importlib import import_module
 from io import BytesIO
 from os import path
 
 from django.core.exceptions import ImproperlyConfigured
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import models
-from django.db.models import signals
 from django.forms import Textarea, ValidationError
 from django.template.defaultfilters import filesizeformat
-from django.utils.encoding import smart_str
 from django.utils.safestring import SafeData, mark_safe
 from django.utils.translation import gettext_lazy as _
 
 from machina.conf import settings as machina_settings
+from machina.core.compat import PILImage, PILImageLanczos
 
 
-_rendered_field_name = lambda name: '_{}_rendered'.format(name)
+def _rendered_field_name(name):
+    return f'_{name}_rendered'
+
+
+def _rawhash_field_name(name):
+    return f'_{name}_rawhash'
+
+
+def _markup_cache_field_name(name):
+    return f'_mt_cache_{name}'
 
 
 def _get_markup_widget():
     dotted_path = machina_settings.MARKUP_WIDGET
     try:
         assert dotted_path is not None
-        module, widget = dotted_path.rsplit('.', 1)
-        module, widget = smart_str(module), smart_str(widget)
-        widget = getattr(__import__(module, {}, {}, [widget]), widget)
-        return widget
+        module_name, widget_name = dotted_path.rsplit('.', 1)
+        return getattr(import_module(module_name), widget_name)
     except ImportError as e:
         raise ImproperlyConfigured(
             _('Could not import MACHINA_MARKUP_WIDGET {}: {}').format(
@@ -40,17 +48,40 @@ MarkupTextFieldWidget = _get_markup_widget()
 
 
 def _get_render_function(dotted_path, kwargs):
-    module, func = dotted_path.rsplit('.', 1)
-    module, func = smart_str(module), smart_str(func)
-    func = getattr(__import__(module, {}, {}, [func]), func)
-    return partial(func, **kwargs)
+    module_name, func_name = dotted_path.rsplit('.', 1)
+    func = getattr(import_module(module_name), func_name)
+    # The function is returned as is when no keyword arguments are configured so that renders do
+    # not pay any partial-call overhead.
+    return partial(func, **kwargs) if kwargs else func
+
+
+# Raw contents longer than this threshold bypass the markup render cache so that a handful of very
+# large posts cannot monopolize the cache memory.
+_RENDER_CACHE_MAX_CONTENT_LENGTH = 16384
+
+
+def _get_cached_render_function(func):
+    """ Wraps the considered render function into a process-wide LRU cache.
+
+    Identical raw contents (quoted posts, boilerplate signatures, etc.) are frequently rendered
+    over and over across instances. Caching the rendered output allows these repeated renders to
+    skip the markup parser entirely.
+    """
+    cached_func = lru_cache(maxsize=machina_settings.MARKUP_CACHE_SIZE)(func)
+
+    def render(raw):
+        if len(raw) >= _RENDER_CACHE_MAX_CONTENT_LENGTH:
+            return func(raw)
+        return cached_func(raw)
+
+    return render
 
 
 try:
     markup_lang = machina_settings.MARKUP_LANGUAGE
     render_func = (
-        _get_render_function(markup_lang[0], markup_lang[1]) if markup_lang
-        else lambda text: text
+        _get_cached_render_function(_get_render_function(markup_lang[0], markup_lang[1]))
+        if markup_lang else lambda text: text
     )
 except ImportError as e:
     raise ImproperlyConfigured(
@@ -63,12 +94,19 @@ except AttributeError:
 
 
 class MarkupText(SafeData):
+    # These wrappers are instantiated on every access to a MarkupTextField attribute so slots are
+    # used to speed up attribute reads through fixed slot offsets. Note that the instances still
+    # carry a __dict__ because SafeData defines no __slots__ of its own ; only the descriptor
+    # below gets the memory benefit.
+    __slots__ = ('instance', 'field_name', 'rendered_field_name', '_rendered_cache')
+
     def __init__(self, instance, field_name, rendered_field_name):
         # Stores a reference to the instance along with field names
         # to make assignment possible.
         self.instance = instance
         self.field_name = field_name
         self.rendered_field_name = rendered_field_name
+        self._rendered_cache = None
 
     # raw is read/write
     def _get_raw(self):
@@ -81,17 +119,25 @@ class MarkupText(SafeData):
 
     # rendered is a read only property
     def _get_rendered(self):
-        return mark_safe(getattr(self.instance, self.rendered_field_name))
+        # mark_safe allocates a new SafeString on every call so the safe wrapper is only built
+        # once per MarkupText instance. This is safe because both assigning new content to the
+        # field and re-rendering the content drop the memoized MarkupText instance along with its
+        # cached wrapper.
+        if self._rendered_cache is None:
+            self._rendered_cache = mark_safe(getattr(self.instance, self.rendered_field_name))
+        return self._rendered_cache
 
     rendered = property(_get_rendered)
 
-    # Allows display via templates to work without safe filter
+    # Allows display via templates to work without safe filter. The raw value is looked up
+    # directly instead of going through the raw property because templates call these methods on
+    # every truthiness test and display of the field.
     def __str__(self):
-        return self.raw
+        return self.instance.__dict__[self.field_name]
 
     # Return the length of the rendered string so that bool tests work as expected
     def __len__(self):
-        return len(self.raw)
+        return len(self.instance.__dict__[self.field_name])
 
 
 class MarkupTextDescriptor:
@@ -102,9 +148,12 @@ class MarkupTextDescriptor:
     separately. These values can be separately updated when something is assigned. When the field is
     accessed, a MarkupText instance will be returned ; this one is built with the current data.
     """
+    __slots__ = ('field', 'rendered_field_name', 'cache_name')
+
     def __init__(self, field):
         self.field = field
-        self.rendered_field_name = _rendered_field_name(self.field.name)
+        self.rendered_field_name = field._rendered_attname
+        self.cache_name = _markup_cache_field_name(self.field.name)
 
     def __get__(self, instance, owner):
         if instance is None:
@@ -112,9 +161,18 @@ class MarkupTextDescriptor:
         raw = instance.__dict__[self.field.name]
         if raw is None:
             return None
-        return MarkupText(instance, self.field.name, self.rendered_field_name)
+        # The wrapper built by a previous access is reused so that repeated reads of the same
+        # attribute (eg. from templates) do not allocate a new MarkupText object each time. The
+        # wrapper reads the raw value directly from the instance so it never becomes stale ; it is
+        # simply dropped when something is assigned to the attribute.
+        markup_text = instance.__dict__.get(self.cache_name)
+        if markup_text is None:
+            markup_text = MarkupText(instance, self.field.name, self.rendered_field_name)
+            instance.__dict__[self.cache_name] = markup_text
+        return markup_text
 
     def __set__(self, instance, value):
+        instance.__dict__.pop(self.cache_name, None)
         if isinstance(value, MarkupText):
             instance.__dict__[self.field.name] = value.raw
             setattr(instance, self.rendered_field_name, value.rendered)
@@ -154,12 +212,15 @@ class MarkupTextField(models.TextField):
             rendered_field = models.TextField(editable=False, blank=True, null=True)
             cls.add_to_class(_rendered_field_name(name), rendered_field)
 
-        # The data will be rendered before each save
-        signals.pre_save.connect(self.render_data, sender=cls)
-
         # Add the default text field
         super().contribute_to_class(cls, name)
 
+        # Caches the derived attribute names so that they do not have to be re-formatted on every
+        # save or attribute access.
+        self._rendered_attname = _rendered_field_name(self.attname)
+        self._rawhash_attname = _rawhash_field_name(self.attname)
+        self._mt_cache_attname = _markup_cache_field_name(self.attname)
+
         # Associates the name of this field to a special descriptor that will return
         # an appropriate Markup object each time the field is accessed
         setattr(cls, name, MarkupTextDescriptor(self))
@@ -169,19 +230,69 @@ class MarkupTextField(models.TextField):
         return value.raw
 
     def get_db_prep_value(self, value, connection=None, prepared=False):
-        try:
+        # The common case on inserts is a plain string, for which raising and catching an
+        # AttributeError would be much more expensive than this single type check.
+        if isinstance(value, MarkupText):
             return value.raw
-        except AttributeError:
-            return value
+        return value
 
-    def render_data(self, signal, sender, instance=None, **kwargs):
-        value = getattr(instance, self.attname)
+    def pre_save(self, model_instance, add):
+        # The markup content is rendered here, just before each save. Doing this from pre_save()
+        # - which Django calls inline while collecting the field values - avoids the dispatch cost
+        # of a pre_save signal receiver on every save of the host model.
+        value = getattr(model_instance, self.attname)
 
-        rendered = None
         if hasattr(value, 'raw'):
-            rendered = render_func(value.raw)
-
-        setattr(instance, _rendered_field_name(self.attname), rendered)
+            # Rendering the markup content is expensive so it is short-circuited when the raw
+            # content has not changed since the last rendering performed on this instance (eg. when
+            # an unmodified instance is saved again). The digest of the raw content is kept on the
+            # instance itself in order to detect such unchanged saves.
+            rawhash = hashlib.blake2b(value.raw.encode('utf-8'), digest_size=16).digest()
+            if model_instance.__dict__.get(self._rawhash_attname) != rawhash:
+                rendered = render_func(value.raw)
+                model_instance.__dict__[self._rawhash_attname] = rawhash
+                setattr(model_instance, self._rendered_attname, rendered)
+                # The memoized wrapper may hold a safe string built from the previous rendered
+                # value, so it is dropped now that the rendered column changed.
+                model_instance.__dict__.pop(self._mt_cache_attname, None)
+        else:
+            setattr(model_instance, self._rendered_attname, None)
+            # The stored digest is cleared so that restoring the previous content on a later save
+            # does not wrongly skip its rendering.
+            model_instance.__dict__.pop(self._rawhash_attname, None)
+
+        return value
+
+    @classmethod
+    def bulk_render(cls, instances, attname):
+        """ Renders the markup content of the given field for a whole batch of instances.
+
+        This is meant to be used together with bulk operations (eg. bulk_create or data
+        migrations) in order to render many contents in a single tight loop, letting the render
+        cache deduplicate identical contents across instances. The rendered values are assigned to
+        the hidden rendered attribute of each instance ; persisting the instances is left to the
+        caller.
+        """
+        rendered_attname = _rendered_field_name(attname)
+        rawhash_attname = _rawhash_field_name(attname)
+        mt_cache_attname = _markup_cache_field_name(attname)
+        for instance in instances:
+            value = getattr(instance, attname)
+            raw = value.raw if hasattr(value, 'raw') else value
+            if raw is None:
+                setattr(instance, rendered_attname, None)
+                # The stored digest and memoized wrapper are cleared so that restoring the
+                # previous content on a later save does not wrongly skip its rendering.
+                instance.__dict__.pop(rawhash_attname, None)
+                instance.__dict__.pop(mt_cache_attname, None)
+                continue
+            setattr(instance, rendered_attname, render_func(raw))
+            instance.__dict__[rawhash_attname] = hashlib.blake2b(
+                raw.encode('utf-8'), digest_size=16,
+            ).digest()
+            # Drops the memoized wrapper since it may hold a safe string built from the previous
+            # rendered value.
+            instance.__dict__.pop(mt_cache_attname, None)
 
     def formfield(self, **kwargs):
         widget = _get_markup_widget()
@@ -191,6 +302,11 @@ class MarkupTextField(models.TextField):
         return field
 
 
+# Maps the output formats that ExtendedImageField.resize_image can produce to their filename
+# extensions.
+_IMAGE_FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png'}
+
+
 class ExtendedImageField(models.ImageField):
     """
     An ExtendedImageField is an ImageField whose image can be resized before being saved.
@@ -209,8 +325,21 @@ class ExtendedImageField(models.ImageField):
         self.max_upload_size = kwargs.pop('max_upload_size', 0)
         super().__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        """ Tells the migration framework how to serialize this field. The resizing and validation
+            options are passed back to the __init__() method so that they are not lost when the
+            field is written into a migration.
+        """
+        name, import_path, args, kwargs = super().deconstruct()
+        for option in ('width', 'height', 'min_width', 'max_width', 'min_height', 'max_height'):
+            value = getattr(self, option)
+            if value is not None:
+                kwargs[option] = value
+        if self.max_upload_size:
+            kwargs['max_upload_size'] = self.max_upload_size
+        return name, import_path, args, kwargs
+
     def clean(self, *args, **kwargs):
-        from django.core.files.images import get_image_dimensions
         data = super().clean(*args, **kwargs)
         image = data.file
 
@@ -224,8 +353,15 @@ class ExtendedImageField(models.ImageField):
                     )
                 )
 
-        # Controls the image size
-        image_width, image_height = get_image_dimensions(data)
+        # Controls the image size. Opening the file with PIL only parses the image header, which
+        # is enough to get the dimensions and the format ; get_image_dimensions would instead feed
+        # the whole file to its parser in small increments. The parsed information is cached on
+        # the file object so that save_form_data can avoid re-opening the image.
+        data.seek(0)
+        pil_image = PILImage.open(data)
+        image_width, image_height = pil_image.size
+        data.seek(0)
+        data._machina_pil_cache = (image_width, image_height, pil_image.format)
         if self.min_width and self.max_width \
                 and not self.min_width <= image_width <= self.max_width:
             raise ValidationError(
@@ -246,25 +382,71 @@ class ExtendedImageField(models.ImageField):
         return data
 
     def save_form_data(self, instance, data):
-        if data and self.width and self.height:
-            content = self.resize_image(data.read(), (self.width, self.height))
+        if data and self.width and self.height and self._resize_required(data):
+            content, image_format = self.resize_image(data, (self.width, self.height))
 
-            # Handle the filename because the image will be converted to PNG
+            # Handle the filename because the image may be converted to another format
             filename = path.splitext(path.split(data.name)[-1])[0]
-            filename = '{}.png'.format(filename)
+            filename = '{}.{}'.format(filename, _IMAGE_FORMAT_EXTENSIONS[image_format])
 
             # Regenerate a File object
             data = SimpleUploadedFile(filename, content)
         super().save_form_data(instance, data)
 
-    def resize_image(self, data, size):
-        """ Resizes the given image to fit inside a box of the given size. """
-        from machina.core.compat import PILImage as Image
-        image = Image.open(BytesIO(data))
+    def _resize_required(self, data):
+        """ Returns False when the image information cached during the cleaning step shows that
+            the image already fits inside the target box and uses a web-friendly format, in which
+            case the whole decode / re-encode round-trip can be skipped.
+        """
+        pil_cache = getattr(data, '_machina_pil_cache', None)
+        if pil_cache is None:
+            return True
+        image_width, image_height, image_format = pil_cache
+        return (
+            image_width > self.width or image_height > self.height or
+            image_format not in _IMAGE_FORMAT_EXTENSIONS
+        )
+
+    def resize_image(self, fp, size):
+        """ Resizes the image available through the given file-like object to fit inside a box of
+            the given size and returns a (content, format) tuple containing the re-encoded image
+            bytes and the output format that was used.
+        """
+        # The file-like object is handed directly to PIL so that the image data does not have to
+        # be copied into an intermediary bytestring. Raw bytestrings and non-seekable streams are
+        # still supported through a BytesIO fallback.
+        if not hasattr(fp, 'seek'):
+            fp = BytesIO(fp.read() if hasattr(fp, 'read') else fp)
+        fp.seek(0)
+        image = PILImage.open(fp)
+
+        # Images that already fit inside the target box and already use a web-friendly format are
+        # passed through unchanged: re-encoding them would cost a full decode / encode cycle
+        # without removing a single pixel.
+        if (
+            image.size[0] <= size[0] and image.size[1] <= size[1] and
+            image.format in _IMAGE_FORMAT_EXTENSIONS
+        ):
+            fp.seek(0)
+            return fp.read(), image.format
+
+        # Instructs the decoder to decode the image at a scale close to the target size when it
+        # supports it (eg. JPEG), so that pixels the thumbnail operation would discard anyway are
+        # never decoded. This is a no-op for the other formats.
+        image.draft(None, size)
 
         # Resize!
-        image.thumbnail(size, Image.ANTIALIAS)
+        image.thumbnail(size, PILImageLanczos)
+
+        # Photographic images are re-encoded as JPEG, which keeps resized files small instead of
+        # forcing every upload through a costly - and often much larger - PNG re-encode. Only the
+        # modes the JPEG encoder can actually write are eligible ; everything else (alpha channel,
+        # palette, 16-bit grayscale, etc.) falls back to PNG.
+        image_format = 'JPEG' if image.mode in ('RGB', 'L', 'CMYK', '1') else 'PNG'
 
         string = BytesIO()
-        image.save(string, format='PNG')
-        return string.getvalue()
+        if image_format == 'JPEG':
+            image.save(string, format=image_format, quality=85, optimize=True, progressive=True)
+        else:
+            image.save(string, format=image_format)
+        return string.getvalue(), image_format
@@ -1,13 +1,17 @@
 from importlib import reload
 from io import BytesIO
 
+import mock
 import pytest
 from django import forms
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.files import File
 from django.utils.encoding import force_str
-from tests.models import RESIZED_IMAGE_HEIGHT, RESIZED_IMAGE_WIDTH, DummyModel
+from tests.models import (
+    RESIZED_IMAGE_HEIGHT, RESIZED_IMAGE_WIDTH, VALIDATED_IMAGE_MAX_SIZE, VALIDATED_IMAGE_MIN_WIDTH,
+    DummyModel
+)
 
 from machina.conf import settings as machina_settings
 from machina.core.compat import PILImage as Image
@@ -60,6 +64,52 @@ class TestMarkupTextField(object):
         with pytest.raises(AttributeError):
             print(DummyModel.content.rendered)
 
+    def test_does_not_render_again_if_the_raw_content_is_unchanged(self):
+        # Setup
+        test = DummyModel()
+        test.content = '**hello**'
+        test.save()
+        # Run & check
+        with mock.patch.object(fields, 'render_func', wraps=fields.render_func) as render_mock:
+            test.save()
+            assert not render_mock.called
+            test.content = '**hello world!**'
+            test.save()
+            assert render_mock.called
+        assert test.content.rendered.rstrip() == '<p><strong>hello world!</strong></p>'
+
+    def test_renders_again_when_the_same_content_is_restored_after_a_none_save(self):
+        # Setup
+        test = DummyModel()
+        test.content = '**hello**'
+        test.save()
+        test.content = None
+        test.save()
+        # Run
+        test.content = '**hello**'
+        test.save()
+        # Check
+        assert test.content.rendered.rstrip() == '<p><strong>hello</strong></p>'
+
+    def test_refreshes_the_rendered_content_accessed_before_a_save(self):
+        # Setup
+        test = DummyModel()
+        test.content = '**hello**'
+        force_str(test.content.rendered)  # Builds the safe wrapper before any rendering happened
+        # Run
+        test.save()
+        # Check
+        assert test.content.rendered.rstrip() == '<p><strong>hello</strong></p>'
+
+    def test_can_render_the_content_of_many_instances_at_once(self):
+        # Setup
+        tests = [DummyModel(content='**hello**'), DummyModel(content='**world!**'), ]
+        # Run
+        fields.MarkupTextField.bulk_render(tests, 'content')
+        # Check
+        assert tests[0].content.rendered.rstrip() == '<p><strong>hello</strong></p>'
+        assert tests[1].content.rendered.rstrip() == '<p><strong>world!</strong></p>'
+
     def test_content_returns_the_raw_value_when_converted_to_a_string(self):
         # Setup
         test = DummyModel()
@@ -183,6 +233,55 @@ class TestExtendedImageField(object):
         image = Image.open(BytesIO(test.resized_image.read()))
         assert image.size == (RESIZED_IMAGE_WIDTH, RESIZED_IMAGE_HEIGHT)
 
+    def test_keeps_photographic_images_in_the_jpeg_format_when_resizing_them(self):
+        # Setup
+        test = DummyModel()
+        # Run
+        field = test._meta.get_field('resized_image')
+        field.save_form_data(test, self.images_dict['too_large_image'])
+        test.full_clean()
+        test.save()
+        # Check
+        image = Image.open(BytesIO(test.resized_image.read()))
+        assert image.format == 'JPEG'
+        assert test.resized_image.name.endswith('.jpg')
+
+    def test_falls_back_to_png_for_images_the_jpeg_encoder_cannot_write(self):
+        # Setup
+        field = DummyModel._meta.get_field('resized_image')
+        content = BytesIO()
+        Image.new('I', (200, 200)).save(content, format='PNG')
+        # Run
+        resized_content, image_format = field.resize_image(content, (100, 100))
+        # Check
+        assert image_format == 'PNG'
+        image = Image.open(BytesIO(resized_content))
+        assert image.size == (100, 100)
+
+    def test_does_not_reencode_images_that_already_fit_inside_the_target_box(self):
+        # Setup
+        field = DummyModel._meta.get_field('resized_image')
+        content = BytesIO()
+        Image.new('RGB', (50, 50)).save(content, format='PNG')
+        # Run
+        resized_content, image_format = field.resize_image(content, (100, 100))
+        # Check
+        assert resized_content == content.getvalue()
+        assert image_format == 'PNG'
+
+    def test_deconstruct_keeps_the_resizing_and_validation_options(self):
+        # Setup
+        field = DummyModel._meta.get_field('validated_image')
+        # Run
+        name, import_path, args, kwargs = field.deconstruct()
+        new_field = fields.ExtendedImageField(*args, **kwargs)
+        # Check
+        assert kwargs['min_width'] == VALIDATED_IMAGE_MIN_WIDTH
+        assert kwargs['max_upload_size'] == VALIDATED_IMAGE_MAX_SIZE
+        assert new_field.min_width == field.min_width
+        assert new_field.max_height == field.max_height
+        assert new_field.max_upload_size == field.max_upload_size
+
     def test_should_not_accept_images_with_incorrect_sizes_or_dimensions(self):
         # Setup
         test = DummyModel()